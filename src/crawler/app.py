@@ -1,4 +1,5 @@
 from argparse import ArgumentParser
+import asyncio
 
 from .crawler import Crawler
 
@@ -35,10 +36,18 @@ def parse_args():
         help="Carpeta destino donde almacenar el contenido"
         " de las URLs crawleadas.",
     )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=50,
+        help="Número de workers que descargan URLs en paralelo.",
+    )
     return parser.parse_args()
 
 
 if __name__ == "__main__":
     args = parse_args()
     crawler = Crawler(args)
-    crawler.crawl()
+    asyncio.run(crawler.crawl())
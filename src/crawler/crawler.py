@@ -1,11 +1,47 @@
 from argparse import Namespace
-from queue import Queue
+from collections import defaultdict
 from typing import Set
+from urllib import robotparser
+from urllib.parse import urlparse
+import asyncio
 import os
-import requests
-import json
+import aiohttp
+import orjson
 import re
-from bs4 import BeautifulSoup  # Añadido para extraer solo el texto útil
+from bs4 import BeautifulSoup, SoupStrainer  # Añadido para extraer solo el texto útil
+
+# Retardo incremental (en segundos) con el que arranca cada worker,
+# para escalonar las peticiones en vez de lanzarlas todas a la vez
+WORKER_STAGGER = 0.1
+
+# Número máximo de peticiones simultáneas contra un mismo host: la
+# concurrencia global solo es segura si ningún servidor la recibe entera
+PER_HOST_CONCURRENCY = 4
+
+# Cabeceras comunes a todas las peticiones: se construyen una sola vez
+# y se asocian a la sesión en lugar de crearlas en cada iteración
+HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/91.0.4472.124 Safari/537.36"
+    )
+}
+
+# Tiempo máximo de conexión y de petición completa, en segundos
+TIMEOUT = aiohttp.ClientTimeout(connect=5, total=15)
+
+# Expresión regular para encontrar URLs con "href" que comiencen con
+# "https://universidadeuropea.com". Se compila una sola vez a nivel de
+# módulo en lugar de recompilarse en cada llamada a find_urls
+_HREF_RE = re.compile(r'href=["\'](https?:\/\/universidadeuropea\.com[^\s"\'<>]*)["\']')
+
+# Solo nos interesa el bloque principal de la página: el SoupStrainer
+# evita construir nodos del árbol fuera de ese subárbol
+_PAGE_STRAINER = SoupStrainer("div", class_="page")
+
+# Etiquetas de las que se extrae el texto dentro del bloque principal
+_EXTRACT_TAGS = ("h1", "h2", "p", "a", "b", "i")
 
 
 class Crawler:
@@ -14,82 +50,173 @@ class Crawler:
     def __init__(self, args: Namespace):
         self.args = args
         self.visited = set()  # URLs visitadas
+        self.enqueued: Set[str] = set()  # URLs ya encoladas alguna vez
+        # La carpeta de salida se crea una sola vez, no en cada página
+        os.makedirs(self.args.output_folder, exist_ok=True)
+        # Caché de robots.txt por host, para consultarlo una sola vez
+        self._robots: dict = {}
+        # Semáforo por host que acota las peticiones simultáneas a cada servidor
+        self._host_sems: defaultdict = defaultdict(
+            lambda: asyncio.Semaphore(PER_HOST_CONCURRENCY)
+        )
 
-    def crawl(self) -> None:
+    async def crawl(self) -> None:
         """
-        Método para crawlear la URL base.
+        Método para crawlear la URL base de forma concurrente.
+
+        El crawler es un proceso limitado por E/S de red, así que en vez
+        de esperar cada petición de forma secuencial se usa una sesión
+        compartida de `aiohttp` y un pool de workers asíncronos: varias
+        descargas avanzan a la vez y el tiempo total se acerca al de la
+        petición más lenta en lugar de a la suma de todas.
         """
-        queue = Queue()
-        queue.put(self.args.url)
-        crawled_count = 0
+        queue: asyncio.Queue = asyncio.Queue()
+        self.enqueued.add(self.args.url)
+        queue.put_nowait(self.args.url)
 
-        # Mientras haya URLs por procesar y no se supere el límite máximo
-        while not queue.empty() and crawled_count < self.args.max_webs:
-            current_url = queue.get()
-            if current_url in self.visited:
-                continue
+        # Semáforo que limita el número de peticiones simultáneas
+        sem = asyncio.Semaphore(self.args.workers)
 
+        # Una única sesión con pool de conexiones Keep-Alive compartido
+        # por todos los workers: los sockets TLS se reutilizan entre
+        # páginas del mismo host en vez de renegociar el handshake
+        # (limit_per_host evita saturar un mismo servidor)
+        connector = aiohttp.TCPConnector(limit=100, limit_per_host=8)
+        async with aiohttp.ClientSession(
+            connector=connector, headers=HEADERS, timeout=TIMEOUT
+        ) as session:
+            workers = [
+                asyncio.create_task(self._worker(i, queue, session, sem))
+                for i in range(self.args.workers)
+            ]
+            # Espera a que la cola quede vacía y termina los workers
+            await queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _worker(
+        self,
+        worker_id: int,
+        queue: asyncio.Queue,
+        session: aiohttp.ClientSession,
+        sem: asyncio.Semaphore,
+    ) -> None:
+        """Worker que procesa URLs de la cola hasta ser cancelado."""
+        # Arranque escalonado: cada worker espera 100ms más que el
+        # anterior para no golpear el servidor con N peticiones a la vez
+        await asyncio.sleep(worker_id * WORKER_STAGGER)
+        while True:
+            current_url = await queue.get()
             try:
-                # Realiza la petición HTTP con User-Agent
-                headers = {
-                    "User-Agent": (
-                        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-                        "AppleWebKit/537.36 (KHTML, like Gecko) "
-                        "Chrome/91.0.4472.124 Safari/537.36"
-                    )
-                }
-                response = requests.get(current_url, headers=headers)
+                await self._process_url(current_url, queue, session, sem)
+            finally:
+                queue.task_done()
+
+    async def _process_url(
+        self,
+        current_url: str,
+        queue: asyncio.Queue,
+        session: aiohttp.ClientSession,
+        sem: asyncio.Semaphore,
+    ) -> None:
+        """Descarga una URL, guarda su contenido y encola los enlaces."""
+        if current_url in self.visited or len(self.visited) >= self.args.max_webs:
+            return
+
+        # Respetar robots.txt antes de pedir la página
+        host = urlparse(current_url).netloc
+        robots = await self._robots_for(host, session)
+        if not robots.can_fetch(HEADERS["User-Agent"], current_url):
+            return
+
+        try:
+            # Realiza la petición HTTP (las cabeceras y el timeout van
+            # en la sesión, que reutiliza la conexión Keep-Alive). El
+            # semáforo por host evita saturar un mismo servidor aunque
+            # haya muchos workers libres
+            async with sem, self._host_sems[host], session.get(current_url) as response:
                 response.raise_for_status()  # Verifica si hubo errores en la respuesta
-            except requests.RequestException as e:
-                print(f"Error al obtener {current_url}: {e}")
-                continue
+                html = await response.text()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error al obtener {current_url}: {e}")
+            return
 
-            # Extrae solo el texto relevante de la página
-            parsed_text = self.extract_text(response.text)
-            if not parsed_text:
-                continue
+        # Otro worker puede haber procesado la misma URL mientras
+        # esperábamos la respuesta
+        if current_url in self.visited or len(self.visited) >= self.args.max_webs:
+            return
 
-            # Guarda el contenido de la página en un archivo JSON
-            self.save_page(current_url, parsed_text)
+        # BeautifulSoup es trabajo de CPU: se delega a un hilo para no
+        # bloquear el event loop mientras se parsea el HTML
+        parsed_text = await asyncio.to_thread(self.extract_text, html)
+        if not parsed_text:
+            return
 
-            # Marca la URL como visitada
-            self.visited.add(current_url)
-            crawled_count += 1
+        # Marca la URL como visitada y guarda el contenido
+        self.visited.add(current_url)
+        self.save_page(current_url, parsed_text)
 
-            # Extrae las URLs y las agrega a la cola
-            for url in self.find_urls(response.text):
-                if url not in self.visited:
-                    queue.put(url)
+        # Extrae las URLs y las agrega a la cola. La deduplicación se
+        # hace al encolar, no al desencolar: cada página re-descubre
+        # los mismos enlaces y sin este filtro la cola crece con el
+        # número de aristas en vez de con el de páginas pendientes
+        for url in await asyncio.to_thread(self.find_urls, html):
+            if url not in self.enqueued:
+                self.enqueued.add(url)
+                queue.put_nowait(url)
+
+    async def _robots_for(
+        self, host: str, session: aiohttp.ClientSession
+    ) -> robotparser.RobotFileParser:
+        """Devuelve el robots.txt parseado de un host, cacheado por host."""
+        if host not in self._robots:
+            robots = robotparser.RobotFileParser()
+            try:
+                async with session.get(f"https://{host}/robots.txt") as response:
+                    if response.status == 200:
+                        robots.parse((await response.text()).splitlines())
+                    else:
+                        # Sin robots.txt: se permite todo
+                        robots.parse([])
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                robots.parse([])
+            self._robots[host] = robots
+        return self._robots[host]
 
     def extract_text(self, html: str) -> str:
-        """Extrae solo el texto relevante del HTML usando BeautifulSoup."""
-        soup = BeautifulSoup(html, "html.parser")
-        
+        """Extrae solo el texto relevante del HTML usando BeautifulSoup.
+
+        Se parsea con `lxml` (parser en C) y un `SoupStrainer` limitado
+        al bloque principal, mucho más rápido que recorrer con
+        `html.parser` el documento completo.
+        """
         # Intentar encontrar contenido principal
+        soup = BeautifulSoup(html, "lxml", parse_only=_PAGE_STRAINER)
         content = soup.find("div", class_="page")
         if content:
-            return " ".join(tag.text for tag in content.find_all(["h1", "h2", "p", "a", "b", "i"]))
-        
+            return " ".join(tag.text for tag in content.find_all(_EXTRACT_TAGS))
+
         # Si no hay un div específico, extraer todo el texto visible
-        return soup.get_text(separator=" ").strip()
+        return BeautifulSoup(html, "lxml").get_text(separator=" ").strip()
 
     def save_page(self, url: str, content: str) -> None:
         """
         Guarda el contenido de una página web en un archivo JSON.
-        """
-        if not os.path.exists(self.args.output_folder):
-            os.makedirs(self.args.output_folder)
 
+        Serializa con `orjson` (sin indentación: la mitad de bytes y
+        mucho menos CPU que `json.dump` con `indent=4`) y escribe los
+        bytes de una vez con un buffer grande.
+        """
         # Nombre del archivo basado en el número de páginas visitadas
         filename = os.path.join(self.args.output_folder, f"{len(self.visited)}.json")
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump({"url": url, "text": content}, f, ensure_ascii=False, indent=4)
+        with open(filename, "wb", buffering=1 << 20) as f:
+            f.write(orjson.dumps({"url": url, "text": content}))
 
     def find_urls(self, text: str) -> Set[str]:
         """
         Encuentra URLs en el texto de una web.
         """
-        # Expresión regular para encontrar URLs con "href" que comiencen con "https://universidadeuropea.com"
-        href_pattern = r'href=["\'](https?:\/\/universidadeuropea\.com[^\s"\'<>]*)["\']'
-        urls = re.findall(href_pattern, text)
-        return set(urls)  # Devuelve un conjunto con URLs únicas
+        # Un findall sobre la regex precompilada basta: no hace falta
+        # construir un árbol HTML solo para descubrir enlaces
+        return set(_HREF_RE.findall(text))  # Devuelve un conjunto con URLs únicas
@@ -1,40 +1,178 @@
 import os
-import json
+import orjson
+from array import array
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 import pickle as pkl
 import re
+import zstandard as zstd
 from argparse import Namespace
 from dataclasses import dataclass, field
 from time import time
-from typing import Dict, List
-from bs4 import BeautifulSoup
-from nltk.tokenize import word_tokenize
+from typing import Dict, List, Set, Tuple
+from bs4 import BeautifulSoup, SoupStrainer
 from nltk.corpus import stopwords
+import numpy as np
+
+# Expresiones regulares de limpieza, compiladas una sola vez a nivel de
+# módulo: la primera sustituye puntuación y símbolos separadores
+# (saltos de línea, tabuladores...) y la segunda colapsa los espacios
+_CLEAN_RE = re.compile(r"[^\w\s]|[\n\t\r]")
+_WS_RE = re.compile(r"\s+")
+
+# Tokenizador basado en regex: sobre texto ya limpio y en minúsculas
+# basta un findall de secuencias alfanuméricas, mucho más ligero que el
+# tokenizador Punkt/Treebank de NLTK
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Solo interesa el bloque principal del documento: el SoupStrainer evita
+# construir nodos fuera de ese subárbol al parsear con lxml
+_PAGE_STRAINER = SoupStrainer("div", class_="page")
+
+# Etiquetas de las que se extrae el texto dentro del bloque principal
+_EXTRACT_TAGS = ("h1", "h2", "p", "a")
+
+# Longitud del snippet que se guarda por documento para los resultados
+_SNIPPET_LEN = 200
+
+
+def encode_vbyte(doc_ids) -> bytes:
+    """Comprime una posting list ordenada con gaps + variable-byte.
+
+    Se guardan las diferencias entre doc_ids consecutivos (gaps), y
+    cada gap se codifica en grupos de 7 bits con un bit de continuación,
+    de forma que los valores pequeños ocupan un solo byte.
+    """
+    out = bytearray()
+    prev = 0
+    for doc_id in doc_ids:
+        gap = int(doc_id) - prev
+        prev = int(doc_id)
+        while gap >= 0x80:
+            out.append((gap & 0x7F) | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return bytes(out)
+
+
+def decode_vbyte(buf) -> np.ndarray:
+    """Descomprime una posting list codificada con `encode_vbyte`.
+
+    Acumula los doc_ids en un `array.array` de C int (4 bytes por
+    entrada, sin un objeto int de Python por doc_id) y lo expone como
+    array de numpy sin copiar, vía el protocolo buffer.
+    """
+    doc_ids = array("i")
+    value = 0
+    shift = 0
+    prev = 0
+    for byte in buf:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            prev += value
+            doc_ids.append(prev)
+            value = 0
+            shift = 0
+    return np.frombuffer(doc_ids, dtype=np.int32)
+
+
+@lru_cache(maxsize=1)
+def _spanish_stopwords() -> frozenset:
+    """Carga las stopwords en español una sola vez por proceso."""
+    return frozenset(stopwords.words("spanish"))
+
+
+def _parse(text: str) -> str:
+    """Extrae el texto del bloque principal de un documento HTML."""
+    # Extraer contenido principal (ejemplo: <div class="page">)
+    soup = BeautifulSoup(text, "lxml", parse_only=_PAGE_STRAINER)
+    main_content = soup.find("div", class_="page")
+    if main_content:
+        return " ".join(
+            tag.get_text() for tag in main_content.find_all(_EXTRACT_TAGS)
+        )
+
+    # Si no hay un bloque principal definido, usamos todo el texto del HTML
+    return BeautifulSoup(text, "lxml").get_text()
+
+
+def _clean(text: str) -> str:
+    """Normaliza el texto (puntuación, espacios, minúsculas) en una pasada."""
+    return _WS_RE.sub(" ", _CLEAN_RE.sub(" ", text)).strip().lower()
+
+
+def process_doc(path: str) -> Tuple[str, str, Set[str]]:
+    """Procesa un documento: lectura, parseo, limpieza y tokens únicos.
+
+    Es una función a nivel de módulo, y no un método, para que
+    `ProcessPoolExecutor` pueda serializarla y ejecutarla en los
+    procesos workers.
+    """
+    with open(path, "rb") as f:
+        data = orjson.loads(f.read())
+
+    clean_text = _clean(_parse(data["text"]))
+    tokens = {
+        token
+        for token in _TOKEN_RE.findall(clean_text)
+        if token not in _spanish_stopwords()
+    }
+    return data["url"], clean_text, tokens
 
 
 @dataclass
 class Document:
-    """Dataclass para representar un documento."""
+    """Dataclass para representar un documento.
+
+    Solo guarda metadatos y un snippet precalculado: mantener el texto
+    completo de cada página dentro del índice multiplicaba el tamaño
+    del fichero y la memoria del retriever, que solo necesita los
+    primeros caracteres para mostrar resultados.
+    """
     id: int
     title: str
     url: str
-    text: str
+    snippet: str
 
 
 @dataclass
 class Index:
-    """Dataclass para representar un índice invertido."""
-    postings: Dict[str, List[int]] = field(default_factory=lambda: {})
+    """Dataclass para representar un índice invertido.
+
+    El índice se guarda en dos ficheros: `<nombre>` contiene los
+    metadatos (documentos y la tabla término -> (offset, longitud)) y
+    `<nombre>.postings` contiene todas las posting lists comprimidas
+    con gaps + variable-byte (`encode_vbyte`) concatenadas. El
+    retriever mapea este último en memoria con `mmap` y decodifica cada
+    lista de forma perezosa, sin reconstruir el grafo de objetos de las
+    posting lists al arrancar.
+    """
+    postings: Dict[str, Tuple[int, int]] = field(default_factory=lambda: {})
     documents: List[Document] = field(default_factory=lambda: [])
 
-    def save(self, output_name: str) -> None:
-        """Serializa el índice (`self`) en formato binario usando Pickle."""
+    def save(self, output_name: str, postings_blobs: Dict[str, bytes]) -> None:
+        """Serializa el índice: metadatos en Pickle y postings aparte."""
         # Crear el directorio si no existe
         output_dir = os.path.dirname(output_name)
         os.makedirs(output_dir, exist_ok=True)
 
-        # Guardar el índice en un archivo binario
-        with open(output_name, "wb") as fw:
-            pkl.dump(self, fw)
+        # Concatenar las posting lists comprimidas en un único fichero,
+        # registrando la posición de cada término en la tabla
+        offset = 0
+        with open(output_name + ".postings", "wb") as fw:
+            for term, buf in postings_blobs.items():
+                fw.write(buf)
+                self.postings[term] = (offset, len(buf))
+                offset += len(buf)
+
+        # Guardar los metadatos comprimidos con zstd y el protocolo de
+        # pickle más reciente (el de por defecto no es el más compacto)
+        compressor = zstd.ZstdCompressor(level=3, threads=-1)
+        with open(output_name, "wb") as fw, compressor.stream_writer(fw) as writer:
+            pkl.dump(self, writer, protocol=pkl.HIGHEST_PROTOCOL)
 
 
 @dataclass
@@ -59,92 +197,73 @@ class Indexer:
         self.args = args
         self.index = Index()
         self.stats = Stats()
+        # Posting lists transitorias durante la construcción: un set por
+        # término hace que insertar un doc_id sea O(1) en lugar del
+        # "if doc_id not in lista" lineal sobre una lista
+        self._build_postings: Dict[str, set] = defaultdict(set)
 
     def build_index(self) -> None:
         """Construye un índice invertido."""
         ts = time()
 
-        # Procesar cada archivo JSON en la carpeta de entrada
-        for filename in os.listdir(self.args.input_folder):
-            filepath = os.path.join(self.args.input_folder, filename)
-            with open(filepath, "r", encoding="utf-8") as f:
-                data = json.load(f)
-
-            url = data["url"]
-            raw_text = data["text"]
-
-            # Parsear y limpiar el texto
-            clean_text = self.parse(raw_text)
-            clean_text = self.remove_split_symbols(clean_text)
-            clean_text = self.remove_elongated_spaces(clean_text)
-            clean_text = self.remove_punctuation(clean_text)
-
-            # Tokenizar y eliminar stopwords
-            tokens = self.tokenize(clean_text)
-            tokens = self.remove_stopwords(tokens)
-
-            # Crear el documento y añadirlo a la lista
-            doc_id = len(self.index.documents)
-            title = url  # O extrae el título real del contenido si es posible
-            document = Document(id=doc_id, title=title, url=url, text=clean_text)
-            self.index.documents.append(document)
-
-            # Actualizar las posting lists del índice
-            # Actualizar las posting lists del índice
-            for token in tokens:
-                if token not in self.index.postings:
-                    self.index.postings[token] = []  # Inicializa la posting list si no existe
-                if doc_id not in self.index.postings[token]:
-                    self.index.postings[token].append(doc_id)
-
+        # El trabajo por documento (parseo HTML, limpieza y
+        # tokenización) es puro CPU e independiente entre documentos,
+        # así que se reparte entre procesos; en el proceso principal
+        # solo queda la fusión de tokens en las posting lists
+        paths = sorted(entry.path for entry in self._iter_docs())
+        with ProcessPoolExecutor() as executor:
+            for doc_id, (url, clean_text, tokens) in enumerate(
+                executor.map(process_doc, paths, chunksize=16)
+            ):
+                # Crear el documento y añadirlo a la lista (solo
+                # metadatos y snippet, no el texto completo)
+                title = url  # O extrae el título real del contenido si es posible
+                document = Document(
+                    id=doc_id, title=title, url=url, snippet=clean_text[:_SNIPPET_LEN]
+                )
+                self.index.documents.append(document)
+
+                # Actualizar las posting lists del índice
+                for token in tokens:
+                    self._build_postings[token].add(doc_id)
+
+        # Materializar cada set como posting list comprimida (gaps +
+        # variable-byte) antes de guardar
+        postings_blobs = {
+            token: encode_vbyte(sorted(doc_ids))
+            for token, doc_ids in self._build_postings.items()
+        }
 
         te = time()
 
-        # Guardar el índice en un archivo binario
-        self.index.save(self.args.output_name)
+        # Guardar el índice en disco
+        self.index.save(self.args.output_name, postings_blobs)
 
         # Mostrar estadísticas
         self.show_stats(building_time=te - ts)
 
+    def _iter_docs(self):
+        """Itera de forma perezosa los archivos JSON de la carpeta de entrada."""
+        with os.scandir(self.args.input_folder) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    yield entry
+
     def parse(self, text: str) -> str:
         """Extrae el texto del bloque principal de un documento HTML."""
-        soup = BeautifulSoup(text, "html.parser")
-
-        # Extraer contenido principal (ejemplo: <div class="page">)
-        main_content = soup.find("div", class_="page")
-        if main_content:
-            text = " ".join(tag.get_text() for tag in main_content.find_all(["h1", "h2", "p", "a"]))
-        else:
-            # Si no hay un bloque principal definido, usamos todo el texto del HTML
-            text = soup.get_text()
-
-        # Convertimos a minúsculas
-        return text.lower()
+        return _parse(text)
 
     def tokenize(self, text: str) -> List[str]:
         """Convierte el texto en una lista de palabras."""
-        try:
-            return word_tokenize(text)
-        except LookupError:
-            # Si NLTK no tiene los recursos necesarios, usamos un método básico
-            return text.split()
+        return _TOKEN_RE.findall(text)
 
     def remove_stopwords(self, words: List[str]) -> List[str]:
         """Elimina palabras vacías (stopwords) de la lista de palabras."""
-        stop_words = set(stopwords.words("spanish"))  # Cambia a "english" si es necesario
-        return [word for word in words if word not in stop_words]
-
-    def remove_punctuation(self, text: str) -> str:
-        """Elimina signos de puntuación del texto."""
-        return re.sub(r"[^\w\s]", "", text)
-
-    def remove_elongated_spaces(self, text: str) -> str:
-        """Elimina espacios duplicados."""
-        return " ".join(text.split())
+        return [word for word in words if word not in _spanish_stopwords()]
 
-    def remove_split_symbols(self, text: str) -> str:
-        """Elimina símbolos separadores como saltos de línea y tabuladores."""
-        return text.replace("\n", " ").replace("\t", " ").replace("\r", " ")
+    def clean(self, text: str) -> str:
+        """Normaliza el texto (puntuación, espacios, minúsculas) en una pasada."""
+        return _clean(text)
 
     def show_stats(self, building_time: float) -> None:
         """Muestra estadísticas del proceso de indexación."""
